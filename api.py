@@ -1,19 +1,61 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
 import os
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 
 # Import the task agent
-from task_agent import SimpleTaskAgent
+from task_agent import SimpleTaskAgent, aclose_task_agent, get_task_agent
+from json_utils import dumps_line
+from env import ensure_env
 
-load_dotenv()
+ensure_env()
+
+# Configured once at the app entry point; the agents only create loggers
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
+# Startup stops waiting on the warmup calls after this many seconds
+WARMUP_TIMEOUT = 10
+
+# Set up by lifespan for each run of the app
+task_agent: Optional[SimpleTaskAgent] = None
+batcher: Optional["RequestBatcher"] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global task_agent, batcher
+    # Built here rather than at import so every startup gets open HTTP clients
+    try:
+        task_agent = get_task_agent()
+    except Exception as e:
+        logger.error("Error initializing task agent: %s", e)
+        task_agent = None
+    batcher = RequestBatcher(task_agent) if task_agent and task_agent.two_stage_analysis else None
+    
+    # Pay the cold-start cost (connections, prompt cache) before serving traffic
+    if task_agent:
+        try:
+            # A slow or unreachable OpenAI must not hold up serving (and health checks)
+            await asyncio.wait_for(task_agent.awarmup(), timeout=WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Warmup did not finish within %ss, serving without it", WARMUP_TIMEOUT)
+    yield
+    # Release the pooled connections along with the agent that holds them
+    if batcher:
+        batcher.close()
+    task_agent = batcher = None
+    await aclose_task_agent()
 
 app = FastAPI(
     title="Smart Task Agent API",
     description="API for generating roles and tasks for projects using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -34,25 +76,102 @@ class TaskResponse(BaseModel):
     selected_roles: list
     role_tasks: Dict[str, list]
 
-# Initialize the task agent
-try:
-    task_agent = SimpleTaskAgent()
-except Exception as e:
-    print(f"Error initializing task agent: {e}")
-    task_agent = None
-
-@app.post("/generate-tasks", response_model=TaskResponse)
-async def generate_tasks(request: ProjectRequest):
+class RequestBatcher:
+    """Coalesce concurrent requests so their role selection shares one LLM call
+    
+    Only worth it for the two-stage flow; the single-call flow already makes
+    one LLM call per request.
     """
-    Generate roles and tasks for a project description
     
-    Args:
-        request: ProjectRequest containing project_description
+    def __init__(self, agent: SimpleTaskAgent, max_batch_size: int = 8, max_wait: float = 0.15, first_wait: float = 0.01):
+        """
+        Initialize the batcher
         
-    Returns:
-        TaskResponse with selected_roles and role_tasks
-    """
+        Args:
+            agent: Task agent that analyzes the batched projects
+            max_batch_size (int): Maximum number of requests per batch
+            max_wait (float): Seconds to keep collecting once a burst is detected
+            first_wait (float): Seconds to wait for a second request before
+                dispatching a lone request on its own
+        """
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.first_wait = first_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Strong references so in-flight dispatches are not garbage collected
+        self._dispatches = set()
+    
+    async def submit(self, project_description: str) -> Dict[str, Any]:
+        """
+        Queue a project for analysis and wait for its result
+        
+        Args:
+            project_description: Description of the project
+            
+        Returns:
+            Dict with selected roles and their tasks
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._collect())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((project_description, future))
+        return await future
+    
+    def close(self):
+        """Stop collecting requests; the worker belongs to the loop being shut down"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
     
+    async def _next(self, timeout: float) -> Optional[Tuple[str, asyncio.Future]]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            
+            # A lone request goes out right away; only bursts wait for the window
+            item = await self._next(self.first_wait)
+            if item is not None:
+                batch.append(item)
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    item = await self._next(deadline - loop.time())
+                    if item is None:
+                        break
+                    batch.append(item)
+            
+            dispatch = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        descriptions = [project_description for project_description, _ in batch]
+        try:
+            if len(batch) == 1:
+                results = [await self.agent.aanalyze_project(descriptions[0])]
+            else:
+                results = await self.agent.aanalyze_projects(descriptions)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+def _validate_request(request: ProjectRequest):
+    """Reject requests that cannot be processed"""
     if not task_agent:
         raise HTTPException(
             status_code=500, 
@@ -65,9 +184,33 @@ async def generate_tasks(request: ProjectRequest):
             detail="Project description cannot be empty"
         )
     
+    # Reject before any LLM work rather than spending a call on it
+    if SimpleTaskAgent.is_too_short(request.project_description):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Project description must have at least {SimpleTaskAgent.MIN_DESCRIPTION_WORDS} words"
+        )
+
+@app.post("/generate-tasks", response_model=TaskResponse)
+async def generate_tasks(request: ProjectRequest):
+    """
+    Generate roles and tasks for a project description
+    
+    Args:
+        request: ProjectRequest containing project_description
+        
+    Returns:
+        TaskResponse with selected_roles and role_tasks
+    """
+    
+    _validate_request(request)
+    
     try:
         # Generate roles and tasks
-        result = task_agent.generate_from_role_agent(request.project_description)
+        if batcher:
+            result = await batcher.submit(request.project_description)
+        else:
+            result = await task_agent.aanalyze_project(request.project_description)
         
         return TaskResponse(
             selected_roles=result.get("selected_roles", []),
@@ -80,7 +223,37 @@ async def generate_tasks(request: ProjectRequest):
             detail=f"Error generating tasks: {str(e)}"
         )
 
+@app.post("/generate-tasks/stream")
+async def generate_tasks_stream(request: ProjectRequest):
+    """
+    Stream roles and tasks for a project description as NDJSON
+    
+    The first line is {"selected_roles": [...]}; each following line is
+    {"role": ..., "tasks": [...]}, sent as soon as the model finishes that role.
+    
+    Args:
+        request: ProjectRequest containing project_description
+        
+    Returns:
+        StreamingResponse with media type application/x-ndjson
+    """
+    
+    _validate_request(request)
+    project_description = request.project_description
+    
+    async def ndjson_lines():
+        role_result = await task_agent.role_agent.aselect_roles(project_description)
+        selected_roles = role_result.get("selected_roles", [])
+        yield dumps_line({"selected_roles": selected_roles})
+        
+        async for role, tasks in task_agent.astream_tasks(project_description, selected_roles):
+            yield dumps_line({"role": role, "tasks": tasks})
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # One worker: the shared HTTP/2 pool and the request batcher are per process,
+    # and concurrency comes from asyncio rather than extra workers
+    uvicorn.run(app, host="0.0.0.0", port=8000, workers=1, loop="uvloop", http="httptools") 
\ No newline at end of file
@@ -0,0 +1,225 @@
+import asyncio
+import atexit
+import copy
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SemanticCache:
+    """Two-level cache of LLM results: exact matches first, then similar project descriptions"""
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        model_name: str = "all-MiniLM-L6-v2",
+        path: Optional[str] = None,
+        max_exact_entries: int = 1024,
+        max_scope_entries: int = 256
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            threshold (float): Minimum cosine similarity counted as a hit
+            model_name (str): sentence-transformers model used for embeddings
+            path (str): Optional file the cache is loaded from and saved to at exit
+            max_exact_entries (int): Size of the in-memory exact-match LRU
+            max_scope_entries (int): Results kept per scope for similarity
+                matching; the oldest is replaced once a scope is full
+        """
+        self.threshold = threshold
+        self.path = path
+        self.max_exact_entries = max_exact_entries
+        self.max_scope_entries = max_scope_entries
+        self.model_name = model_name
+        self.model = None
+        try:
+            # Imported lazily: sentence-transformers pulls in torch
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_name)
+        except ImportError:
+            # Semantic matching is optional; without it only identical descriptions hit
+            pass
+        # blake2b(scope, text) -> value, most recently used last
+        self._exact: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # scope -> {"texts": [...], "values": [...], "embeddings": (capacity, dim)
+        # array whose first len(texts) rows are filled, "model": model that made
+        # the embeddings, "next": slot replaced next once the scope is full}
+        self._scopes: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        if path:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    self._scopes = pickle.load(f)
+                for scope, entry in self._scopes.items():
+                    entry.setdefault("next", 0)
+                    if self.model is not None:
+                        self._reindex(entry)
+                    for text, value in zip(entry["texts"], entry["values"]):
+                        self._remember(self._exact_key(text, scope), value)
+            # Written once at exit rather than on every store
+            atexit.register(self.save)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def _exact_key(normalized_text: str, scope: str) -> str:
+        return hashlib.blake2b(f"{scope}|{normalized_text}".encode()).hexdigest()
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._exact[key] = value
+        self._exact.move_to_end(key)
+        if len(self._exact) > self.max_exact_entries:
+            self._exact.popitem(last=False)
+
+    def _embed(self, text: str):
+        return self.model.encode([text], normalize_embeddings=True)[0]
+
+    def _reindex(self, entry: Dict[str, Any]):
+        """Re-embed a loaded scope saved without embeddings or with another model's"""
+        embeddings = entry["embeddings"]
+        if (
+            embeddings is not None
+            and entry.get("model") == self.model_name
+            and len(embeddings) >= len(entry["texts"])
+        ):
+            return
+        entry["embeddings"] = None
+        if entry["texts"]:
+            entry["embeddings"] = self.model.encode(entry["texts"], normalize_embeddings=True)
+            entry["model"] = self.model_name
+        self._dirty = True
+
+    def _exact_hit(self, normalized: str, scope: str) -> Optional[Dict[str, Any]]:
+        key = self._exact_key(normalized, scope)
+        if key in self._exact:
+            self._exact.move_to_end(key)
+            return copy.deepcopy(self._exact[key])
+        return None
+
+    def _searchable(self, scope: str) -> Optional[Dict[str, Any]]:
+        entry = self._scopes.get(scope)
+        if not entry or self.model is None or entry["embeddings"] is None:
+            return None
+        return entry
+
+    def _search(self, entry: Dict[str, Any], embedding) -> Optional[Dict[str, Any]]:
+        # Embeddings are normalized, so the inner product is cosine similarity
+        scores = entry["embeddings"][:len(entry["texts"])] @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] > self.threshold:
+            return copy.deepcopy(entry["values"][best])
+        return None
+
+    def _add(self, normalized: str, value: Dict[str, Any], scope: str, embedding):
+        value = copy.deepcopy(value)
+        self._remember(self._exact_key(normalized, scope), value)
+
+        entry = self._scopes.setdefault(scope, {"texts": [], "values": [], "embeddings": None, "next": 0})
+        size = len(entry["texts"])
+        if size < self.max_scope_entries:
+            slot = size
+            entry["texts"].append(normalized)
+            entry["values"].append(value)
+        else:
+            # Full: replace the oldest result
+            slot = entry["next"]
+            entry["next"] = (slot + 1) % self.max_scope_entries
+            entry["texts"][slot] = normalized
+            entry["values"][slot] = value
+
+        if embedding is not None:
+            embeddings = entry["embeddings"]
+            if embeddings is None or slot >= len(embeddings):
+                # Grow by doubling so appends do not copy the whole array each time
+                capacity = min(self.max_scope_entries, max(16, 2 * slot))
+                grown = np.empty((capacity, embedding.shape[0]), dtype=embedding.dtype)
+                if embeddings is not None:
+                    grown[:slot] = embeddings[:slot]
+                entry["embeddings"] = embeddings = grown
+                entry["model"] = self.model_name
+            embeddings[slot] = embedding
+        elif entry["embeddings"] is not None:
+            # Rows would no longer line up with the texts; re-embedded when a
+            # run with the model loads the file
+            entry["embeddings"] = None
+        self._dirty = True
+
+    def lookup(self, text: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Find a cached result for the text
+
+        Args:
+            text (str): Project description to match
+            scope (str): Exact-match discriminator, e.g. the selected roles
+
+        Returns:
+            A copy of the cached result, or None on a miss
+        """
+        normalized = self._normalize(text)
+
+        # Level 1: identical description, no embedding needed
+        cached = self._exact_hit(normalized, scope)
+        if cached is not None:
+            return cached
+
+        # Level 2: similar description
+        entry = self._searchable(scope)
+        if entry is None:
+            return None
+        return self._search(entry, self._embed(normalized))
+
+    async def alookup(self, text: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Async version of lookup; the embedding is computed off the event loop"""
+        normalized = self._normalize(text)
+
+        cached = self._exact_hit(normalized, scope)
+        if cached is not None:
+            return cached
+
+        entry = self._searchable(scope)
+        if entry is None:
+            return None
+        embedding = await asyncio.to_thread(self._embed, normalized)
+        # Re-read the scope: it may have changed while the embedding was computed
+        return self._search(self._scopes[scope], embedding)
+
+    def store(self, text: str, value: Dict[str, Any], scope: str = ""):
+        """
+        Add a result to the cache
+
+        Args:
+            text (str): Project description the result was generated for
+            value (Dict): Parsed LLM result
+            scope (str): Exact-match discriminator, e.g. the selected roles
+        """
+        normalized = self._normalize(text)
+        embedding = self._embed(normalized) if self.model is not None else None
+        self._add(normalized, value, scope, embedding)
+
+    async def astore(self, text: str, value: Dict[str, Any], scope: str = ""):
+        """Async version of store; the embedding is computed off the event loop"""
+        normalized = self._normalize(text)
+        embedding = await asyncio.to_thread(self._embed, normalized) if self.model is not None else None
+        self._add(normalized, value, scope, embedding)
+
+    def save(self):
+        """Write the similarity entries to `path`, if set and anything changed"""
+        if not self.path or not self._dirty:
+            return
+        # Write then rename so a crash mid-write keeps the previous file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._scopes, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
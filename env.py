@@ -0,0 +1,20 @@
+import os
+from typing import Optional
+
+_env_loaded = False
+
+
+def ensure_env():
+    """Load .env into the process environment, once, on first use"""
+    global _env_loaded
+    if not _env_loaded:
+        # Imported here so importing the agents does no file I/O
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_openai_api_key() -> Optional[str]:
+    """Return the OpenAI API key from the environment or .env"""
+    ensure_env()
+    return os.getenv("OPENAI_API_KEY")
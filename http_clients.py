@@ -0,0 +1,40 @@
+import atexit
+
+import httpx
+
+# Shared by every agent so repeated OpenAI calls reuse warm HTTP/2 connections
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+_TIMEOUT = 60
+
+_http_client = None
+_async_http_client = None
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide HTTP client used for synchronous OpenAI calls"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+        # The sync client can always be closed at exit; the async one needs a
+        # running loop and is closed by the API's shutdown handler instead
+        atexit.register(_http_client.close)
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client used for async OpenAI calls"""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+    return _async_http_client
+
+
+async def aclose_http_clients():
+    """Close the shared HTTP clients, e.g. when the API shuts down"""
+    global _http_client, _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
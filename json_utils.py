@@ -0,0 +1,39 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+    from orjson import loads
+except ImportError:
+    from json import loads
+    orjson = None
+
+
+def dumps_line(obj: Any) -> bytes:
+    """
+    Serialize an object as one compact JSON line
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        UTF-8 encoded JSON followed by a newline
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def dumps_pretty(obj: Any) -> str:
+    """
+    Serialize an object as indented JSON for display
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        JSON text indented by two spaces
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, indent=2, ensure_ascii=False)
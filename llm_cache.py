@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumpd, load
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+from json_utils import dumps_line, loads
+
+# Cached responses older than this are treated as misses
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# The only classes a cache file may deserialize into; the directory comes from
+# an environment variable, so nothing else is trusted
+_ALLOWED_OBJECTS = [Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+
+logger = logging.getLogger(__name__)
+
+_llm_cache = None
+
+
+class DiskLLMCache(BaseCache):
+    """LangChain LLM cache that keeps each response in its own JSON file"""
+
+    def __init__(self, cache_dir: str, ttl: float = DEFAULT_TTL):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir (str): Directory the responses are written to
+            ttl (float): Seconds a cached response stays valid
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, prompt: str, llm_string: str) -> str:
+        # llm_string covers the model name, temperature and bound kwargs
+        key = hashlib.sha256(f"{llm_string}\n{prompt}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Return the cached generations for the prompt, or None on a miss"""
+        path = self._path(prompt, llm_string)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return [
+                    load(generation, allowed_objects=_ALLOWED_OBJECTS)
+                    for generation in loads(f.read())
+                ]
+        except (OSError, ValueError):
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        """Write the generations for the prompt to disk"""
+        path = self._path(prompt, llm_string)
+        # Write then rename so concurrent readers never see a partial file; a
+        # unique temp file per write, since aupdate runs update on a thread pool
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dumps_line([dumpd(generation) for generation in return_val]))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The completion already succeeded; a failed write only costs a future hit
+            logger.warning("Could not write LLM cache entry %s: %s", path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self, **kwargs: Any):
+        """Delete every cached response"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def get_llm_cache() -> Optional[DiskLLMCache]:
+    """Return the process-wide disk cache if LLM_CACHE_DIR is set, else None"""
+    global _llm_cache
+    cache_dir = os.getenv("LLM_CACHE_DIR")
+    if _llm_cache is None and cache_dir:
+        _llm_cache = DiskLLMCache(cache_dir, ttl=float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL)))
+    return _llm_cache
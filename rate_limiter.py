@@ -0,0 +1,99 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+_limiter = None
+
+
+class RateLimiter:
+    """Token bucket that keeps OpenAI calls within request and token per-minute limits"""
+
+    def __init__(self, requests_per_minute: float = math.inf, tokens_per_minute: float = math.inf):
+        """
+        Initialize the limiter with full buckets
+
+        Args:
+            requests_per_minute (float): Requests allowed per minute
+            tokens_per_minute (float): Prompt plus completion tokens allowed per minute
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        # Shared by the sync and async paths, which may run on different threads
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take capacity for one request, or return how long to wait for it"""
+        # A request larger than the whole bucket would otherwise wait forever
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0.0
+
+            wait = 0.0
+            if self._requests < 1:
+                wait = (1 - self._requests) * 60 / self.requests_per_minute
+            if self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            return wait
+
+    def acquire(self, tokens: int = 0):
+        """Block until one request using about `tokens` tokens fits the limits"""
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """Async version of acquire"""
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def as_runnable(self, default_max_tokens: int = 0):
+        """
+        Chain step that waits for capacity and passes the prompt through unchanged
+
+        Args:
+            default_max_tokens (int): Completion budget assumed when the call's
+                config does not set max_tokens
+        """
+        from langchain_core.runnables import RunnableLambda
+
+        def estimate(prompt_value, config) -> int:
+            # Roughly four characters per token, plus the whole completion budget
+            max_tokens = config.get("configurable", {}).get("max_tokens") or default_max_tokens
+            return len(prompt_value.to_string()) // 4 + max_tokens
+
+        def gate(prompt_value, config):
+            self.acquire(estimate(prompt_value, config))
+            return prompt_value
+
+        async def agate(prompt_value, config):
+            await self.aacquire(estimate(prompt_value, config))
+            return prompt_value
+
+        return RunnableLambda(gate, afunc=agate)
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Return the limiter shared by all agents if OPENAI_RPM or OPENAI_TPM is set, else None"""
+    global _limiter
+    rpm = os.getenv("OPENAI_RPM")
+    tpm = os.getenv("OPENAI_TPM")
+    if _limiter is None and (rpm or tpm):
+        _limiter = RateLimiter(
+            requests_per_minute=float(rpm) if rpm else math.inf,
+            tokens_per_minute=float(tpm) if tpm else math.inf
+        )
+    return _limiter
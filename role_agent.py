@@ -1,11 +1,35 @@
 import os
-import json
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from cache import SemanticCache
+from json_utils import dumps_pretty
+from env import get_openai_api_key
+from rate_limiter import get_rate_limiter
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+def _format_taxonomy(taxonomy: Dict[str, List[str]]) -> str:
+    """Render a role taxonomy as the catalog text shown to the LLM, one domain per line"""
+    # Full role names are kept so the model can return them verbatim
+    return "\n".join(f"{domain}: {', '.join(roles)}" for domain, roles in taxonomy.items())
+
+class RoleSelection(BaseModel):
+    """Structured output of role selection"""
+    selected_roles: List[str]
+
+class RoleSelections(BaseModel):
+    """Structured output of multi-project role selection"""
+    results: List[RoleSelection]
+
+def _parse_role_selection(message) -> RoleSelection:
+    """Validate a JSON-mode response directly into RoleSelection"""
+    return RoleSelection.model_validate_json(message.content)
+
+def _parse_role_selections(message) -> RoleSelections:
+    """Validate a JSON-mode response directly into RoleSelections"""
+    return RoleSelections.model_validate_json(message.content)
 
 class SimpleRoleAgent:
     """Simple role selection agent that analyzes projects and selects optimal team roles"""
@@ -60,32 +84,80 @@ class SimpleRoleAgent:
         ]
     }
     
-    def __init__(self):
-        """Initialize the role agent with OpenAI API"""
-        OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-        print(f"API Key loaded: {'Yes' if OPENAI_API_KEY else 'No'}")
-        if OPENAI_API_KEY:
-            print(f"API Key starts with: {OPENAI_API_KEY[:10]}...")
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3, api_key=OPENAI_API_KEY)
+    # Built once at import rather than for every agent instance
+    ROLES_TEXT = _format_taxonomy(ROLE_TAXONOMY)
+    # Flat role -> domain lookup
+    ROLE_DOMAINS = {role: domain for domain, roles in ROLE_TAXONOMY.items() for role in roles}
+    
+    # (prompt, multi_prompt), built on first use and shared by all instances
+    _prompts = None
+    
+    # Cache scope for role selections, apart from the task scopes keyed by roles
+    CACHE_SCOPE = "__roles__"
+    
+    # The reply is a short JSON list of role names; multi-project replies get
+    # this budget once per project
+    MAX_TOKENS = 256
+    # A selection outside this range, as the prompt asks for, is escalated
+    MIN_ROLES = 3
+    MAX_ROLES = 6
+    
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        fallback_model: Optional[str] = None,
+        cache: Optional[SemanticCache] = None
+    ):
+        """
+        Initialize the role agent with OpenAI API
+        
+        Args:
+            model (str): OpenAI model used for role selection
+            fallback_model (str): Optional stronger model (e.g. "gpt-4-turbo") to retry
+                with when the first selection has too few roles
+            cache (SemanticCache): Cache to share with other agents; a new one is
+                created if not given
+        """
+        # Imported here so the CLI starts without paying for LangChain
+        from langchain_openai import ChatOpenAI
+        from http_clients import get_async_http_client, get_http_client
+        from llm_cache import get_llm_cache
+        
+        OPENAI_API_KEY = get_openai_api_key()
+        if not OPENAI_API_KEY:
+            logger.warning("OPENAI_API_KEY is not set")
+        self.fallback_model = fallback_model
+        self.llm = ChatOpenAI(
+            model=model,
+            temperature=0.3,
+            max_tokens=self.MAX_TOKENS,
+            api_key=OPENAI_API_KEY,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            # Opt-in on-disk response cache, enabled by setting LLM_CACHE_DIR
+            cache=get_llm_cache()
+        )
+        # Reuse roles selected for the same or a similar project description
+        self.cache = cache if cache is not None else SemanticCache(path=os.getenv("SEMANTIC_CACHE_PATH"))
         self._setup_prompt()
     
-    def _setup_prompt(self):
-        """Create simple prompt template for role selection"""
+    @classmethod
+    def _build_prompts(cls):
+        """Create the role selection prompt templates once per process"""
+        if cls._prompts is not None:
+            return cls._prompts
+        
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.messages import SystemMessage
         
-        # Convert role taxonomy to simple text format
-        roles_text = ""
-        for domain, roles in self.ROLE_TAXONOMY.items():
-            roles_text += f"\n{domain}:\n"
-            for role in roles:
-                roles_text += f"  - {role}\n"
+        roles_text = cls.ROLES_TEXT
         
-        template = """
+        # Static instructions and catalog go first so OpenAI can cache the
+        # prompt prefix; only the project description varies per call
+        system_template = """
 You are a technical team composition expert. Analyze the project and select 3-6 most relevant roles.
 
-PROJECT DESCRIPTION:
-{project_description}
-
-AVAILABLE ROLES:
+AVAILABLE ROLES (domain: comma-separated role names):
 {available_roles}
 
 INSTRUCTIONS:
@@ -97,11 +169,50 @@ REQUIRED OUTPUT FORMAT:
 {{"selected_roles": ["Role Name 1", "Role Name 2", "Role Name 3"]}}
 """
         
-        self.prompt = PromptTemplate(
-            input_variables=["project_description", "available_roles"],
-            template=template
-        )
-        self.roles_text = roles_text
+        # Same prefix as the single-project prompt, so both share the prompt cache
+        multi_system_template = system_template + """
+When several numbered projects are given, select roles for each project independently
+and return one result per project, in the same order:
+{{"results": [{{"selected_roles": ["Role Name 1", "Role Name 2"]}}, {{"selected_roles": ["Role Name 3", "Role Name 4"]}}]}}
+"""
+        
+        # The system messages never change, so render them (catalog included)
+        # once here rather than re-substituting the catalog on every call
+        system_message = SystemMessage(content=system_template.format(available_roles=roles_text))
+        multi_system_message = SystemMessage(content=multi_system_template.format(available_roles=roles_text))
+        
+        prompt = ChatPromptTemplate.from_messages([
+            system_message,
+            ("user", "PROJECT DESCRIPTION:\n{project_description}")
+        ])
+        multi_prompt = ChatPromptTemplate.from_messages([
+            multi_system_message,
+            ("user", "PROJECTS:\n{projects}")
+        ])
+        cls._prompts = (prompt, multi_prompt)
+        return cls._prompts
+    
+    def _setup_prompt(self):
+        """Create simple prompt template for role selection"""
+        from langchain_core.runnables import ConfigurableField, RunnableLambda
+        
+        self.prompt, self.multi_prompt = self._build_prompts()
+        self.roles_text = self.ROLES_TEXT
+        
+        # Compose the pipelines once instead of on every call; JSON mode
+        # guarantees a parseable object, validated straight into the model.
+        # The model and output budget are configurable per call, for the
+        # fallback model and for multi-project replies
+        llm = self.llm.configurable_fields(
+            max_tokens=ConfigurableField(id="max_tokens"),
+            model_name=ConfigurableField(id="model_name")
+        ).bind(response_format={"type": "json_object"})
+        # Opt-in shared rate limit (OPENAI_RPM / OPENAI_TPM) across all agents
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            llm = limiter.as_runnable(self.MAX_TOKENS) | llm
+        self.chain = self.prompt | llm | RunnableLambda(_parse_role_selection)
+        self.multi_chain = self.multi_prompt | llm | RunnableLambda(_parse_role_selections)
     
     def select_roles(self, project_description: str) -> Dict[str, List[str]]:
         """
@@ -113,35 +224,220 @@ REQUIRED OUTPUT FORMAT:
         Returns:
             Dict with selected roles list
         """
+        cached = self._cached_roles(project_description)
+        if cached is not None:
+            return cached
+        
         try:
             # Generate response from LLM
-            chain = self.prompt | self.llm
-            result = chain.invoke({
-                "project_description": project_description,
-                "available_roles": self.roles_text
-            })
-            # Handle JSON in markdown code blocks
-            response_text = result.content.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith('```'):
-                # Find the JSON content between code blocks
-                lines = response_text.split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if line.startswith('```'):
-                        in_json = not in_json
-                        continue
-                    if in_json:
-                        json_lines.append(line)
-                response_text = '\n'.join(json_lines).strip()
+            inputs = {"project_description": project_description}
+            role_result = self.chain.invoke(inputs).model_dump()
+            
+            # Retry with the stronger model only when the cheap one underdelivers
+            if self.fallback_model and self._needs_escalation(role_result):
+                role_result = self.chain.invoke(inputs, config=self._fallback_config()).model_dump()
             
-            return json.loads(response_text)
+            return self._store_roles(project_description, role_result)
                 
         except Exception as e:
-            print(f"Error: {e}")
-            # Fallback response
-            return {"selected_roles": ["Frontend Developer", "Backend Developer"]}
+            logger.warning("Role selection failed, using fallback roles: %s", e)
+            return self._fallback_roles()
+    
+    async def aselect_roles(self, project_description: str) -> Dict[str, List[str]]:
+        """
+        Async version of select_roles
+        
+        Args:
+            project_description (str): Description of the project
+            
+        Returns:
+            Dict with selected roles list
+        """
+        cached = await self._acached_roles(project_description)
+        if cached is not None:
+            return cached
+        
+        try:
+            inputs = {"project_description": project_description}
+            role_result = (await self.chain.ainvoke(inputs)).model_dump()
+            
+            if self.fallback_model and self._needs_escalation(role_result):
+                role_result = (await self.chain.ainvoke(inputs, config=self._fallback_config())).model_dump()
+            
+            return await self._astore_roles(project_description, role_result)
+                
+        except Exception as e:
+            logger.warning("Role selection failed, using fallback roles: %s", e)
+            return self._fallback_roles()
+    
+    def select_roles_multi(self, project_descriptions: List[str]) -> List[Dict[str, List[str]]]:
+        """
+        Select roles for several projects with a single LLM call
+        
+        Args:
+            project_descriptions (List[str]): Descriptions of the projects
+            
+        Returns:
+            List of dicts with selected roles, in the same order as the descriptions
+        """
+        results = [None] * len(project_descriptions)
+        pending = []
+        for i, project_description in enumerate(project_descriptions):
+            results[i] = self._cached_roles(project_description)
+            if results[i] is None:
+                pending.append(i)
+        
+        if len(pending) == 1:
+            results[pending[0]] = self.select_roles(project_descriptions[pending[0]])
+        elif pending:
+            try:
+                projects = "\n".join(
+                    f"{n}) {project_descriptions[i]}" for n, i in enumerate(pending, 1)
+                )
+                batch = self.multi_chain.invoke({
+                    "projects": projects
+                }, config=self._multi_config(len(pending))).results
+                if len(batch) != len(pending):
+                    raise ValueError(f"Expected {len(pending)} results, got {len(batch)}")
+                batch = [role_result.model_dump() for role_result in batch]
+                
+                # Escalate only the projects the cheap model underdelivered on
+                if self.fallback_model:
+                    escalate = [n for n, role_result in enumerate(batch) if self._needs_escalation(role_result)]
+                    retried = self.chain.batch(
+                        [{"project_description": project_descriptions[pending[n]]} for n in escalate],
+                        config=self._fallback_config()
+                    ) if escalate else []
+                    for n, role_result in zip(escalate, retried):
+                        batch[n] = role_result.model_dump()
+                
+                for i, role_result in zip(pending, batch):
+                    results[i] = self._store_roles(project_descriptions[i], role_result)
+                    
+            except Exception as e:
+                logger.warning("Batched role selection failed, retrying per project: %s", e)
+                # Fall back to one call per project
+                for i in pending:
+                    results[i] = self.select_roles(project_descriptions[i])
+        
+        return results
+    
+    async def aselect_roles_multi(self, project_descriptions: List[str]) -> List[Dict[str, List[str]]]:
+        """
+        Select roles for several projects with a single LLM call
+        
+        Args:
+            project_descriptions (List[str]): Descriptions of the projects
+            
+        Returns:
+            List of dicts with selected roles, in the same order as the descriptions
+        """
+        results = [None] * len(project_descriptions)
+        pending = []
+        for i, project_description in enumerate(project_descriptions):
+            results[i] = await self._acached_roles(project_description)
+            if results[i] is None:
+                pending.append(i)
+        
+        if len(pending) == 1:
+            results[pending[0]] = await self.aselect_roles(project_descriptions[pending[0]])
+        elif pending:
+            try:
+                projects = "\n".join(
+                    f"{n}) {project_descriptions[i]}" for n, i in enumerate(pending, 1)
+                )
+                result = await self.multi_chain.ainvoke({
+                    "projects": projects
+                }, config=self._multi_config(len(pending)))
+                batch = result.results
+                if len(batch) != len(pending):
+                    raise ValueError(f"Expected {len(pending)} results, got {len(batch)}")
+                batch = [role_result.model_dump() for role_result in batch]
+                
+                # Escalate only the projects the cheap model underdelivered on
+                if self.fallback_model:
+                    escalate = [n for n, role_result in enumerate(batch) if self._needs_escalation(role_result)]
+                    retried = await asyncio.gather(*(
+                        self.chain.ainvoke(
+                            {"project_description": project_descriptions[pending[n]]},
+                            config=self._fallback_config()
+                        )
+                        for n in escalate
+                    ))
+                    for n, role_result in zip(escalate, retried):
+                        batch[n] = role_result.model_dump()
+                
+                for i, role_result in zip(pending, batch):
+                    results[i] = await self._astore_roles(project_descriptions[i], role_result)
+                    
+            except Exception as e:
+                logger.warning("Batched role selection failed, retrying per project: %s", e)
+                # Fall back to one call per project
+                single = await asyncio.gather(
+                    *(self.aselect_roles(project_descriptions[i]) for i in pending)
+                )
+                for i, role_result in zip(pending, single):
+                    results[i] = role_result
+        
+        return results
+    
+    def _multi_config(self, project_count: int) -> Dict[str, any]:
+        """Runnable config with an output budget for one selection per project"""
+        return {"configurable": {"max_tokens": self.MAX_TOKENS * project_count}}
+    
+    def _fallback_config(self) -> Dict[str, any]:
+        """Runnable config that switches the chain to the fallback model"""
+        return {"configurable": {"model_name": self.fallback_model}}
+    
+    @classmethod
+    def _needs_escalation(cls, role_result: Dict[str, List[str]]) -> bool:
+        """Whether a selection has the wrong number of roles or names outside the catalog"""
+        roles = role_result.get("selected_roles", [])
+        return not cls.MIN_ROLES <= len(roles) <= cls.MAX_ROLES or not _VALID_ROLES.issuperset(roles)
+    
+    def _cached_roles(self, project_description: str) -> Optional[Dict[str, List[str]]]:
+        """Return a copy of previously selected roles, or None on a miss"""
+        return self.cache.lookup(project_description, scope=self.CACHE_SCOPE)
+    
+    async def _acached_roles(self, project_description: str) -> Optional[Dict[str, List[str]]]:
+        """Async version of _cached_roles"""
+        return await self.cache.alookup(project_description, scope=self.CACHE_SCOPE)
+    
+    @staticmethod
+    def _clean_roles(role_result: Dict[str, List[str]]) -> Optional[Dict[str, List[str]]]:
+        """Drop made-up and repeated role names, or return None if none are left"""
+        # Names the model made up never reach task generation, and a role
+        # listed twice is kept once
+        selected_roles = list(dict.fromkeys(
+            role for role in role_result.get("selected_roles", []) if role in _VALID_ROLES
+        ))
+        return {"selected_roles": selected_roles} if selected_roles else None
+    
+    def _store_roles(self, project_description: str, role_result: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Remember successfully selected roles for repeated descriptions"""
+        cleaned = self._clean_roles(role_result)
+        # Nothing usable is left; never cache that for the description
+        if cleaned is None:
+            logger.warning("No catalog roles in the selection, using fallback roles")
+            return self._fallback_roles()
+        self.cache.store(project_description, cleaned, scope=self.CACHE_SCOPE)
+        return cleaned
+    
+    async def _astore_roles(self, project_description: str, role_result: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Async version of _store_roles"""
+        cleaned = self._clean_roles(role_result)
+        if cleaned is None:
+            logger.warning("No catalog roles in the selection, using fallback roles")
+            return self._fallback_roles()
+        await self.cache.astore(project_description, cleaned, scope=self.CACHE_SCOPE)
+        return cleaned
+    
+    def _fallback_roles(self) -> Dict[str, List[str]]:
+        """Fallback response when the LLM call or parsing fails"""
+        return {"selected_roles": ["Web Frontend Developer", "Backend Developer"]}
+
+# Role names the LLM may return
+_VALID_ROLES = frozenset(SimpleRoleAgent.ROLE_DOMAINS)
 
 def main():
     """Demo the simple role agent"""
@@ -160,15 +456,15 @@ def main():
             "An enterprise blockchain supply chain management platform"
         ]
         
-        for i, project in enumerate(test_projects, 1):
+        # Get role recommendations for all projects in one LLM call
+        results = agent.select_roles_multi(test_projects)
+        
+        for i, (project, result) in enumerate(zip(test_projects, results), 1):
             print(f"Project {i}: {project}")
             
-            # Get role recommendations
-            result = agent.select_roles(project)
-            
             # Print JSON result
             print("Selected Roles:")
-            print(json.dumps(result, indent=2))
+            print(dumps_pretty(result))
             print("-" * 40)
         
     except ValueError as e:
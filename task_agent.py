@@ -1,40 +1,196 @@
 import os
-import json
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel, field_validator
 from role_agent import SimpleRoleAgent
+from json_utils import dumps_line, loads
+from cache import SemanticCache
+from env import ensure_env, get_openai_api_key
+from rate_limiter import get_rate_limiter
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+def _dedupe(items: List[str]) -> List[str]:
+    """Drop repeated entries, ignoring case, keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for item in items:
+        key = item.lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+class RoleTasks(BaseModel):
+    """Structured output of task generation"""
+    role_tasks: Dict[str, List[str]]
+    
+    @field_validator("role_tasks")
+    @classmethod
+    def _dedupe_tasks(cls, role_tasks: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        # Over-eager models restate tasks; repeats would only inflate the result
+        return {role: _dedupe(tasks) for role, tasks in role_tasks.items()}
+
+class ProjectBreakdown(RoleTasks):
+    """Structured output of single-call role selection and task generation"""
+    selected_roles: List[str]
+
+@lru_cache(maxsize=256)
+def _format_roles(selected_roles: Tuple[str, ...]) -> str:
+    """Render the selected roles for the prompt; the same role sets recur across requests"""
+    return "\n".join(f"- {role}" for role in selected_roles)
+
+@lru_cache(maxsize=1)
+def _timestamp(minute_bucket: float) -> str:
+    """Format the current UTC time once per minute for bulk saves"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+def _parse_role_tasks(message) -> RoleTasks:
+    """Validate a JSON-mode response directly into RoleTasks"""
+    return RoleTasks.model_validate_json(message.content)
+
+def _parse_breakdown(message) -> ProjectBreakdown:
+    """Validate a JSON-mode response directly into ProjectBreakdown"""
+    return ProjectBreakdown.model_validate_json(message.content)
+
+class _RoleStreamParser:
+    """Incrementally parse line-delimited role tasks from streamed LLM output"""
+    
+    __slots__ = ("_buffer",)
+    
+    def __init__(self):
+        self._buffer = ""
+    
+    def feed(self, text: str) -> List[Tuple[str, List[str]]]:
+        """
+        Add streamed text and return the roles completed by it
+        
+        Args:
+            text (str): Next chunk of LLM output
+            
+        Returns:
+            List of (role, tasks) pairs whose lines are now complete
+        """
+        # Most chunks are single tokens; only split when a line has ended
+        if "\n" not in text:
+            self._buffer += text
+            return []
+        
+        # One split per chunk; the trailing partial line stays buffered
+        *lines, self._buffer = (self._buffer + text).split("\n")
+        parse_line = self._parse_line
+        return [parsed for parsed in map(parse_line, lines) if parsed]
+    
+    def close(self) -> List[Tuple[str, List[str]]]:
+        """Parse whatever is left once the stream has ended"""
+        parsed = self._parse_line(self._buffer)
+        self._buffer = ""
+        return [parsed] if parsed else []
+    
+    @staticmethod
+    def _parse_line(line: str):
+        line = line.strip()
+        # Skip code fences and any prose around the JSON lines
+        if not line.startswith("{"):
+            return None
+        try:
+            item = loads(line)
+        except ValueError:
+            return None
+        if not item.get("role"):
+            return None
+        return item["role"], _dedupe(item.get("tasks", []))
 
 class SimpleTaskAgent:
     """Simple task generator that creates tasks based on selected roles"""
     
-    def __init__(self):
-        """Initialize the task agent with OpenAI API"""
-        OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3, api_key=OPENAI_API_KEY)
-        self.role_agent = SimpleRoleAgent()
+    # Maximum number of LLM calls in flight at once in aanalyze_projects;
+    # tune to the account's OpenAI rate limit (MAX_CONCURRENT_PROJECTS)
+    MAX_CONCURRENT_PROJECTS = 20
+    
+    # Projects whose roles are selected together in a single LLM call
+    ROLE_BATCH_SIZE = 8
+    
+    # Output token budget scales with the number of roles; the model tends
+    # to fill whatever budget it is given. JSON cut off at the limit fails
+    # validation and falls back to placeholder tasks, so the budget never
+    # drops below MAX_TOKENS_MIN
+    MAX_TOKENS_MIN = 900
+    MAX_TOKENS_BASE = 100
+    MAX_TOKENS_PER_ROLE = 250
+    MAX_TOKENS_LIMIT = 1600
+    
+    # Shorter descriptions cannot be broken down meaningfully, so they are
+    # answered without an LLM call
+    MIN_DESCRIPTION_WORDS = 3
+    
+    # Select roles and generate tasks in two LLM calls instead of one; the
+    # single-call flow falls back to this when its output is unusable
+    # (TWO_STAGE_ANALYSIS=1)
+    TWO_STAGE_ANALYSIS = False
+    
+    # (prompt, stream_prompt, breakdown_prompt), built on first use and shared
+    # by all instances
+    _prompts = None
+    
+    def __init__(self, model: str = "gpt-4o-mini", fallback_model: Optional[str] = None):
+        """
+        Initialize the task agent with OpenAI API
+        
+        Args:
+            model (str): OpenAI model used for task generation
+            fallback_model (str): Optional stronger model (e.g. "gpt-4-turbo") to retry
+                with when the first breakdown or role selection comes back too thin
+        """
+        # Imported here so the CLI starts without paying for LangChain
+        from langchain_openai import ChatOpenAI
+        from http_clients import get_async_http_client, get_http_client
+        from llm_cache import get_llm_cache
+        
+        OPENAI_API_KEY = get_openai_api_key()
+        # Environment overrides are read here, after .env has been loaded
+        self.max_concurrent_projects = int(os.getenv("MAX_CONCURRENT_PROJECTS", self.MAX_CONCURRENT_PROJECTS))
+        self.two_stage_analysis = os.getenv("TWO_STAGE_ANALYSIS", "1" if self.TWO_STAGE_ANALYSIS else "0") == "1"
+        self.fallback_model = fallback_model
+        self.llm = ChatOpenAI(
+            model=model,
+            temperature=0.3,
+            api_key=OPENAI_API_KEY,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            # Opt-in on-disk response cache, enabled by setting LLM_CACHE_DIR
+            cache=get_llm_cache()
+        )
+        # One cache (and one embedding model) serves both agents
+        self.cache = SemanticCache(path=os.getenv("SEMANTIC_CACHE_PATH"))
+        self.role_agent = SimpleRoleAgent(fallback_model=fallback_model, cache=self.cache)
         self._setup_prompt()
     
-    def _setup_prompt(self):
-        """Create simple prompt template for task generation"""
+    @classmethod
+    def _build_prompts(cls):
+        """Create the task generation prompt templates once per process"""
+        if cls._prompts is not None:
+            return cls._prompts
+        
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.messages import SystemMessage
         
-        template = """
+        # Static instructions go in the system message so OpenAI can cache the
+        # prompt prefix; the project and roles follow in the user message
+        instructions = """
 You are a project task allocation expert. Generate 3-5 specific tasks for each role based on the project.
 
-PROJECT DESCRIPTION:
-{project_description}
-
-SELECTED ROLES:
-{selected_roles}
-
 INSTRUCTIONS:
 - Create 3-5 specific, actionable tasks for each role
 - Make tasks relevant to the project requirements
 - Include technical details and tools where appropriate
-- Return response as valid JSON format only
+"""
+        
+        system_template = instructions + """- Return response as valid JSON format only
 
 REQUIRED OUTPUT FORMAT:
 {{
@@ -54,10 +210,84 @@ REQUIRED OUTPUT FORMAT:
 }}
 """
         
-        self.prompt = PromptTemplate(
-            input_variables=["project_description", "selected_roles"],
-            template=template
+        # One JSON object per line lets each role be parsed as soon as it is generated
+        stream_system_template = instructions + """- Return one JSON object per role, each on its own line, with no other text
+
+REQUIRED OUTPUT FORMAT:
+{{"role": "Role Name 1", "tasks": ["Task 1 description", "Task 2 description", "Task 3 description"]}}
+{{"role": "Role Name 2", "tasks": ["Task 1 description", "Task 2 description", "Task 3 description", "Task 4 description"]}}
+"""
+        
+        # Role selection and task generation in one call, for analyze_project
+        breakdown_system_template = """
+You are a technical team composition and task allocation expert. Analyze the project, select the 3-6 most relevant roles, then generate 3-5 specific tasks for each selected role.
+
+AVAILABLE ROLES (domain: comma-separated role names):
+{available_roles}
+
+INSTRUCTIONS:
+- Select only the most essential roles, using the role names exactly as listed
+- Create 3-5 specific, actionable tasks for each selected role
+- Make tasks relevant to the project requirements
+- Include technical details and tools where appropriate
+- Return response as valid JSON format only
+
+REQUIRED OUTPUT FORMAT:
+{{
+  "selected_roles": ["Role Name 1", "Role Name 2", "Role Name 3"],
+  "role_tasks": {{
+    "Role Name 1": ["Task 1 description", "Task 2 description", "Task 3 description"],
+    "Role Name 2": ["Task 1 description", "Task 2 description", "Task 3 description"],
+    "Role Name 3": ["Task 1 description", "Task 2 description", "Task 3 description", "Task 4 description"]
+  }}
+}}
+"""
+        
+        user_template = """PROJECT DESCRIPTION:
+{project_description}
+
+SELECTED ROLES:
+{selected_roles}"""
+        
+        # Static system messages are rendered once instead of on every call
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=system_template.format()),
+            ("user", user_template)
+        ])
+        stream_prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=stream_system_template.format()),
+            ("user", user_template)
+        ])
+        breakdown_prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=breakdown_system_template.format(available_roles=SimpleRoleAgent.ROLES_TEXT)),
+            ("user", "PROJECT DESCRIPTION:\n{project_description}")
+        ])
+        cls._prompts = (prompt, stream_prompt, breakdown_prompt)
+        return cls._prompts
+    
+    def _setup_prompt(self):
+        """Create simple prompt template for task generation"""
+        from langchain_core.runnables import ConfigurableField, RunnableLambda
+        
+        self.prompt, self.stream_prompt, self.breakdown_prompt = self._build_prompts()
+        
+        # Compose the pipelines once; max_tokens (and the fallback model) are
+        # supplied per call through the runnable config
+        llm = self.llm.configurable_fields(
+            max_tokens=ConfigurableField(id="max_tokens"),
+            model_name=ConfigurableField(id="model_name")
         )
+        # JSON mode guarantees a parseable object for the non-streaming paths
+        json_llm = llm.bind(response_format={"type": "json_object"})
+        # Opt-in shared rate limit (OPENAI_RPM / OPENAI_TPM) across all agents
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            gate = limiter.as_runnable(self.MAX_TOKENS_LIMIT)
+            json_llm = gate | json_llm
+            llm = gate | llm
+        self.chain = self.prompt | json_llm | RunnableLambda(_parse_role_tasks)
+        self.breakdown_chain = self.breakdown_prompt | json_llm | RunnableLambda(_parse_breakdown)
+        self.stream_chain = self.stream_prompt | llm
     
     def generate_tasks(self, project_description: str, selected_roles: List[str]) -> Dict[str, any]:
         """
@@ -71,56 +301,312 @@ REQUIRED OUTPUT FORMAT:
             Dict with role tasks
         """
         # Format roles for prompt
-        roles_text = "\n".join(f"- {role}" for role in selected_roles)
+        roles_text = _format_roles(tuple(selected_roles))
+        
+        # Reuse tasks generated for a similar project with the same roles
+        cached = self.cache.lookup(project_description, scope=self._cache_scope(selected_roles))
+        if cached is not None:
+            return cached
         
         try:
             # Generate response from LLM
-            chain = self.prompt | self.llm
-            result = chain.invoke({
+            inputs = {
                 "project_description": project_description,
                 "selected_roles": roles_text
-            })
+            }
+            task_result = self.chain.invoke(inputs, config=self._task_config(len(selected_roles))).model_dump()
             
-            # Handle JSON in markdown code blocks
-            response_text = result.content.strip()
+            # Retry with the stronger model only when the cheap one underdelivers
+            if self.fallback_model and self._is_thin(task_result, selected_roles):
+                config = self._task_config(len(selected_roles), model=self.fallback_model)
+                task_result = self.chain.invoke(inputs, config=config).model_dump()
             
-            # Remove markdown code blocks if present
-            if response_text.startswith('```'):
-                lines = response_text.split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if line.startswith('```'):
-                        in_json = not in_json
-                        continue
-                    if in_json:
-                        json_lines.append(line)
-                response_text = '\n'.join(json_lines).strip()
+            return self._store_tasks(project_description, selected_roles, task_result)
+                
+        except Exception as e:
+            logger.warning("Task generation failed, using fallback tasks: %s", e)
+            return self._fallback_tasks(selected_roles)
+    
+    async def agenerate_tasks(self, project_description: str, selected_roles: List[str]) -> Dict[str, any]:
+        """
+        Async version of generate_tasks
+        
+        Args:
+            project_description (str): Description of the project
+            selected_roles (List[str]): List of selected roles
+            
+        Returns:
+            Dict with role tasks
+        """
+        roles_text = _format_roles(tuple(selected_roles))
+        
+        cached = await self.cache.alookup(project_description, scope=self._cache_scope(selected_roles))
+        if cached is not None:
+            return cached
+        
+        try:
+            inputs = {
+                "project_description": project_description,
+                "selected_roles": roles_text
+            }
+            task_result = (await self.chain.ainvoke(inputs, config=self._task_config(len(selected_roles)))).model_dump()
+            
+            # Retry with the stronger model only when the cheap one underdelivers
+            if self.fallback_model and self._is_thin(task_result, selected_roles):
+                config = self._task_config(len(selected_roles), model=self.fallback_model)
+                task_result = (await self.chain.ainvoke(inputs, config=config)).model_dump()
+            
+            return await self._astore_tasks(project_description, selected_roles, task_result)
+                
+        except Exception as e:
+            logger.warning("Task generation failed, using fallback tasks: %s", e)
+            return self._fallback_tasks(selected_roles)
+    
+    def stream_tasks(self, project_description: str, selected_roles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Generate tasks, yielding each role as soon as its tasks are complete
+        
+        Args:
+            project_description (str): Description of the project
+            selected_roles (List[str]): List of selected roles
+            
+        Yields:
+            (role, tasks) pairs in the order the model produces them
+        """
+        roles_text = _format_roles(tuple(selected_roles))
+        
+        cached = self.cache.lookup(project_description, scope=self._cache_scope(selected_roles))
+        if cached is not None:
+            yield from cached.get("role_tasks", {}).items()
+            return
+        
+        role_tasks = {}
+        try:
+            parser = _RoleStreamParser()
+            for chunk in self.stream_chain.stream({
+                "project_description": project_description,
+                "selected_roles": roles_text
+            }, config=self._task_config(len(selected_roles))):
+                for role, tasks in self._accept_streamed(parser.feed(chunk.content), selected_roles, role_tasks):
+                    yield role, tasks
+            for role, tasks in self._accept_streamed(parser.close(), selected_roles, role_tasks):
+                yield role, tasks
+                
+        except Exception as e:
+            logger.warning("Task streaming failed, using fallback tasks for the rest: %s", e)
+        
+        # Fill in the roles the stream did not get to; only a complete
+        # result is reused for other projects with these roles
+        missing = self._missing_roles(selected_roles, role_tasks)
+        if missing:
+            yield from self._fallback_tasks(missing)["role_tasks"].items()
+            return
+        
+        self._store_tasks(project_description, selected_roles, {"role_tasks": role_tasks})
+    
+    async def astream_tasks(self, project_description: str, selected_roles: List[str]) -> AsyncIterator[Tuple[str, List[str]]]:
+        """
+        Async version of stream_tasks
+        
+        Args:
+            project_description (str): Description of the project
+            selected_roles (List[str]): List of selected roles
             
-            return json.loads(response_text)
+        Yields:
+            (role, tasks) pairs in the order the model produces them
+        """
+        roles_text = _format_roles(tuple(selected_roles))
+        
+        cached = await self.cache.alookup(project_description, scope=self._cache_scope(selected_roles))
+        if cached is not None:
+            for role, tasks in cached.get("role_tasks", {}).items():
+                yield role, tasks
+            return
+        
+        role_tasks = {}
+        try:
+            parser = _RoleStreamParser()
+            async for chunk in self.stream_chain.astream({
+                "project_description": project_description,
+                "selected_roles": roles_text
+            }, config=self._task_config(len(selected_roles))):
+                for role, tasks in self._accept_streamed(parser.feed(chunk.content), selected_roles, role_tasks):
+                    yield role, tasks
+            for role, tasks in self._accept_streamed(parser.close(), selected_roles, role_tasks):
+                yield role, tasks
                 
         except Exception as e:
-            print(f"Error: {e}")
-            # Fallback response
-            fallback_tasks = {}
-            for role in selected_roles:
-                fallback_tasks[role] = [
-                    f"Set up development environment for {role}",
-                    f"Implement core functionality",
-                    f"Test and optimize components"
-                ]
-            return {"role_tasks": fallback_tasks}
+            logger.warning("Task streaming failed, using fallback tasks for the rest: %s", e)
+        
+        missing = self._missing_roles(selected_roles, role_tasks)
+        if missing:
+            for role, tasks in self._fallback_tasks(missing)["role_tasks"].items():
+                yield role, tasks
+            return
+        
+        await self._astore_tasks(project_description, selected_roles, {"role_tasks": role_tasks})
+    
+    @staticmethod
+    def _accept_streamed(parsed: List[Tuple[str, List[str]]], selected_roles: List[str], role_tasks: Dict[str, List[str]]) -> List[Tuple[str, List[str]]]:
+        """Record streamed roles that were asked for and not yet seen, and return them"""
+        accepted = []
+        for role, tasks in parsed:
+            if role in selected_roles and role not in role_tasks:
+                role_tasks[role] = tasks
+                accepted.append((role, tasks))
+        return accepted
+    
+    @staticmethod
+    def _missing_roles(selected_roles: List[str], role_tasks: Dict[str, List[str]]) -> List[str]:
+        """Selected roles the stream produced no tasks for"""
+        missing = [role for role in selected_roles if role not in role_tasks]
+        if missing:
+            logger.warning("Task stream missed %d of %d roles, using fallback tasks for them", len(missing), len(selected_roles))
+        return missing
+    
+    def _task_config(self, role_count: int, model: Optional[str] = None) -> Dict[str, any]:
+        """Runnable config with an output budget sized to the number of roles"""
+        configurable = {
+            "max_tokens": max(self.MAX_TOKENS_MIN, min(
+                self.MAX_TOKENS_LIMIT,
+                self.MAX_TOKENS_BASE + self.MAX_TOKENS_PER_ROLE * role_count
+            ))
+        }
+        if model:
+            configurable["model_name"] = model
+        return {"configurable": configurable}
+    
+    @staticmethod
+    def _is_thin(task_result: Dict[str, any], selected_roles: List[str]) -> bool:
+        """Whether a breakdown covers too few roles or has too few tasks per role"""
+        role_tasks = task_result.get("role_tasks", {})
+        if len(role_tasks) < min(3, len(selected_roles)):
+            return True
+        task_count = sum(len(tasks) for tasks in role_tasks.values())
+        return task_count < 2 * len(role_tasks)
+    
+    def _breakdown_config(self, model: Optional[str] = None) -> Dict[str, any]:
+        """Runnable config for the single-call flow, budgeted for the most roles it may pick"""
+        return self._task_config(self.role_agent.MAX_ROLES, model=model)
+    
+    def _needs_retry(self, breakdown: Dict[str, any]) -> bool:
+        """Whether a single-call breakdown fails the role or task checks"""
+        return (
+            self.role_agent._needs_escalation(breakdown)
+            or self._is_thin(breakdown, breakdown.get("selected_roles", []))
+        )
+    
+    @staticmethod
+    def _clean_breakdown(breakdown: Dict[str, any]) -> Dict[str, any]:
+        """Keep only catalog roles and their tasks from a single-call breakdown"""
+        # Validate before caching so an unusable reply falls back cleanly
+        role_result = SimpleRoleAgent._clean_roles(breakdown)
+        if role_result is None:
+            raise ValueError("No catalog roles in single-call breakdown")
+        
+        selected_roles = role_result["selected_roles"]
+        return {
+            "selected_roles": selected_roles,
+            "role_tasks": {
+                role: breakdown["role_tasks"][role]
+                for role in selected_roles
+                if role in breakdown["role_tasks"]
+            }
+        }
+    
+    def _store_breakdown(self, project_description: str, breakdown: Dict[str, any]) -> Dict[str, any]:
+        """Cache a single-call breakdown as if it came from the two-stage flow"""
+        result = self._clean_breakdown(breakdown)
+        selected_roles = result["selected_roles"]
+        self.role_agent._store_roles(project_description, {"selected_roles": selected_roles})
+        # Only a complete breakdown is reused for other projects with these roles
+        if len(result["role_tasks"]) == len(selected_roles):
+            self._store_tasks(project_description, selected_roles, {"role_tasks": result["role_tasks"]})
+        return self._fill_breakdown(result)
+    
+    async def _astore_breakdown(self, project_description: str, breakdown: Dict[str, any]) -> Dict[str, any]:
+        """Async version of _store_breakdown"""
+        result = self._clean_breakdown(breakdown)
+        selected_roles = result["selected_roles"]
+        await self.role_agent._astore_roles(project_description, {"selected_roles": selected_roles})
+        if len(result["role_tasks"]) == len(selected_roles):
+            await self._astore_tasks(project_description, selected_roles, {"role_tasks": result["role_tasks"]})
+        return self._fill_breakdown(result)
+    
+    def _fill_breakdown(self, result: Dict[str, any]) -> Dict[str, any]:
+        """Give selected roles the reply left without tasks the fallback tasks"""
+        missing = [role for role in result["selected_roles"] if role not in result["role_tasks"]]
+        if missing:
+            logger.warning("Single-call breakdown missed tasks for %d of %d roles, using fallback tasks for them", len(missing), len(result["selected_roles"]))
+            result["role_tasks"].update(self._fallback_tasks(missing)["role_tasks"])
+        return result
+    
+    @classmethod
+    def is_too_short(cls, project_description: str) -> bool:
+        """Whether a description has too few words to be worth an LLM call"""
+        return len(project_description.split(None, cls.MIN_DESCRIPTION_WORDS)) < cls.MIN_DESCRIPTION_WORDS
+    
+    @staticmethod
+    def _empty_result() -> Dict[str, any]:
+        return {"selected_roles": [], "role_tasks": {}}
+    
+    @staticmethod
+    def _cache_scope(selected_roles: List[str]) -> str:
+        """Cache scope for a role set; the order the roles were selected in does not matter"""
+        return "|".join(sorted(selected_roles))
+    
+    def _store_tasks(self, project_description: str, selected_roles: List[str], task_result: Dict[str, any]) -> Dict[str, any]:
+        """Cache generated tasks for similar projects"""
+        self.cache.store(project_description, task_result, scope=self._cache_scope(selected_roles))
+        return task_result
+    
+    async def _astore_tasks(self, project_description: str, selected_roles: List[str], task_result: Dict[str, any]) -> Dict[str, any]:
+        """Async version of _store_tasks"""
+        await self.cache.astore(project_description, task_result, scope=self._cache_scope(selected_roles))
+        return task_result
+    
+    def _fallback_tasks(self, selected_roles: List[str]) -> Dict[str, any]:
+        """Fallback response when the LLM call or parsing fails"""
+        fallback_tasks = {}
+        for role in selected_roles:
+            fallback_tasks[role] = [
+                f"Set up development environment for {role}",
+                f"Implement core functionality",
+                f"Test and optimize components"
+            ]
+        return {"role_tasks": fallback_tasks}
     
     def analyze_project(self, project_description: str) -> Dict[str, any]:
         """
         Complete workflow: Get roles and generate tasks
         
+        Roles and tasks come from a single LLM call unless TWO_STAGE_ANALYSIS
+        is set or the roles are already cached.
+        
         Args:
             project_description (str): Description of the project
             
         Returns:
             Dict with selected roles and their tasks
         """
+        if self.is_too_short(project_description):
+            return self._empty_result()
+        
+        # Known roles make the two-stage flow cheap: it can reuse cached tasks
+        if not self.two_stage_analysis and self.role_agent._cached_roles(project_description) is None:
+            try:
+                inputs = {"project_description": project_description}
+                breakdown = self.breakdown_chain.invoke(inputs, config=self._breakdown_config()).model_dump()
+                
+                if self.fallback_model and self._needs_retry(breakdown):
+                    config = self._breakdown_config(model=self.fallback_model)
+                    breakdown = self.breakdown_chain.invoke(inputs, config=config).model_dump()
+                
+                return self._store_breakdown(project_description, breakdown)
+                
+            except Exception as e:
+                logger.warning("Single-call analysis failed, using the two-stage flow: %s", e)
+        
         # Step 1: Get roles from role agent
         role_result = self.role_agent.select_roles(project_description)
         selected_roles = role_result.get('selected_roles', [])
@@ -133,6 +619,171 @@ REQUIRED OUTPUT FORMAT:
             "selected_roles": selected_roles,
             "role_tasks": task_result.get("role_tasks", {})
         }
+    
+    async def aanalyze_project(self, project_description: str) -> Dict[str, any]:
+        """
+        Async version of analyze_project
+        
+        Args:
+            project_description (str): Description of the project
+            
+        Returns:
+            Dict with selected roles and their tasks
+        """
+        if self.is_too_short(project_description):
+            return self._empty_result()
+        
+        if not self.two_stage_analysis and await self.role_agent._acached_roles(project_description) is None:
+            try:
+                inputs = {"project_description": project_description}
+                breakdown = (await self.breakdown_chain.ainvoke(inputs, config=self._breakdown_config())).model_dump()
+                
+                if self.fallback_model and self._needs_retry(breakdown):
+                    config = self._breakdown_config(model=self.fallback_model)
+                    breakdown = (await self.breakdown_chain.ainvoke(inputs, config=config)).model_dump()
+                
+                return await self._astore_breakdown(project_description, breakdown)
+                
+            except Exception as e:
+                logger.warning("Single-call analysis failed, using the two-stage flow: %s", e)
+        
+        role_result = await self.role_agent.aselect_roles(project_description)
+        selected_roles = role_result.get('selected_roles', [])
+        
+        task_result = await self.agenerate_tasks(project_description, selected_roles)
+        
+        return {
+            "selected_roles": selected_roles,
+            "role_tasks": task_result.get("role_tasks", {})
+        }
+    
+    async def aanalyze_projects(self, project_descriptions: List[str]) -> List[Dict[str, any]]:
+        """
+        Analyze several projects concurrently
+        
+        Each project gets its own single-call breakdown. With
+        TWO_STAGE_ANALYSIS set, roles are instead selected for up to
+        ROLE_BATCH_SIZE projects per LLM call, then tasks are generated for
+        each project concurrently.
+        
+        Args:
+            project_descriptions (List[str]): Descriptions of the projects
+            
+        Returns:
+            List of analysis results, in the same order as the descriptions
+        """
+        # Bound in-flight LLM calls to stay within OpenAI rate limits
+        semaphore = asyncio.Semaphore(self.max_concurrent_projects)
+        
+        # One call per project already; batching role selection would only add
+        # a second round trip
+        if not self.two_stage_analysis:
+            async def analyze(project_description: str) -> Dict[str, any]:
+                async with semaphore:
+                    return await self.aanalyze_project(project_description)
+            
+            return list(await asyncio.gather(*(analyze(d) for d in project_descriptions)))
+        
+        async def select(batch: List[str]) -> List[Dict[str, List[str]]]:
+            async with semaphore:
+                return await self.role_agent.aselect_roles_multi(batch)
+        
+        async def generate(project_description: str, role_result: Dict[str, List[str]]) -> Dict[str, any]:
+            selected_roles = role_result.get('selected_roles', [])
+            async with semaphore:
+                task_result = await self.agenerate_tasks(project_description, selected_roles)
+            return {
+                "selected_roles": selected_roles,
+                "role_tasks": task_result.get("role_tasks", {})
+            }
+        
+        results: List[Dict[str, any]] = [self._empty_result() for _ in project_descriptions]
+        indices = [i for i, description in enumerate(project_descriptions) if not self.is_too_short(description)]
+        project_descriptions = [project_descriptions[i] for i in indices]
+        
+        batches = [
+            project_descriptions[i:i + self.ROLE_BATCH_SIZE]
+            for i in range(0, len(project_descriptions), self.ROLE_BATCH_SIZE)
+        ]
+        role_results = [
+            role_result
+            for batch_results in await asyncio.gather(*(select(batch) for batch in batches))
+            for role_result in batch_results
+        ]
+        
+        generated = await asyncio.gather(*(
+            generate(project_description, role_result)
+            for project_description, role_result in zip(project_descriptions, role_results)
+        ))
+        for i, result in zip(indices, generated):
+            results[i] = result
+        return results
+    
+    def _warmup_calls(self) -> List[Tuple[any, Dict[str, str], Optional[Dict[str, any]]]]:
+        """(chain, inputs, config) for one tiny call per chain the configured flow uses"""
+        ping = {"project_description": "warmup ping"}
+        config = {"configurable": {"max_tokens": 16}}
+        # The role chain serves the stream endpoint in either mode; tasks come
+        # from the breakdown chain unless the two-stage flow is enabled
+        if self.two_stage_analysis:
+            warmup_roles = ("Backend Developer",)
+            task_call = (self.chain, {**ping, "selected_roles": _format_roles(warmup_roles)}, config)
+        else:
+            task_call = (self.breakdown_chain, ping, config)
+        return [(self.role_agent.chain, ping, None), task_call]
+    
+    def warmup(self):
+        """Sync version of awarmup"""
+        for chain, inputs, config in self._warmup_calls():
+            # Each call is independent; a failed one must not skip the next
+            try:
+                chain.invoke(inputs, config=config)
+            except Exception:
+                pass
+    
+    async def awarmup(self):
+        """Open the connection pool and prime OpenAI's prompt cache with one tiny call per chain"""
+        # The task output is cut short and will not validate; only the round
+        # trip matters, so failures are ignored
+        await asyncio.gather(
+            *(chain.ainvoke(inputs, config=config) for chain, inputs, config in self._warmup_calls()),
+            return_exceptions=True
+        )
+    
+    def save_results_jsonl(self, results: List[Dict[str, any]], path: str = "project_breakdowns.jsonl"):
+        """
+        Append analysis results to a JSON Lines file, one result per line
+        
+        Args:
+            results (List[Dict]): Results from analyze_project / aanalyze_projects
+            path (str): File to append to
+        """
+        generated_at = _timestamp(time.time() // 60)
+        # A large buffer coalesces the whole batch into a few writes
+        with open(path, "ab", buffering=1 << 20) as f:
+            for result in results:
+                f.write(dumps_line({**result, "generated_at": generated_at}))
+
+@lru_cache(maxsize=1)
+def get_task_agent() -> SimpleTaskAgent:
+    """Return the process-wide task agent, creating it on first use"""
+    # Opt-in stronger model for escalated role selections and breakdowns
+    ensure_env()
+    return SimpleTaskAgent(fallback_model=os.getenv("FALLBACK_MODEL") or None)
+
+async def aclose_task_agent():
+    """
+    Save the process-wide agent's cache and close the shared HTTP clients
+    
+    The agent is dropped with its clients, so the next get_task_agent() call
+    builds a new one instead of reusing closed connections.
+    """
+    from http_clients import aclose_http_clients
+    
+    if get_task_agent.cache_info().currsize:
+        get_task_agent().cache.save()
+        get_task_agent.cache_clear()
+    await aclose_http_clients()
 
 def main():
     """Demo the simple task agent"""
@@ -141,7 +792,9 @@ def main():
     
     try:
         # Initialize agent
-        agent = SimpleTaskAgent()
+        agent = get_task_agent()
+        # Open the connection pool before the first real call
+        agent.warmup()
         print("✅ Agent initialized\n")
         
         # Test projects
@@ -150,15 +803,20 @@ def main():
             "A mobile fitness app with social features and AI workout recommendations"
         ]
         
-        for i, project in enumerate(test_projects, 1):
+        # Select roles for every project in one LLM call
+        role_results = agent.role_agent.select_roles_multi(test_projects)
+        
+        for i, (project, role_result) in enumerate(zip(test_projects, role_results), 1):
             print(f"Project {i}: {project}")
             
-            # Get complete analysis
-            result = agent.analyze_project(project)
+            # Print each role's tasks as soon as it arrives
+            selected_roles = role_result.get('selected_roles', [])
+            print(f"Selected Roles: {', '.join(selected_roles)}")
             
-            # Print JSON result
-            print("Analysis Result:")
-            print(json.dumps(result, indent=2))
+            for role, tasks in agent.stream_tasks(project, selected_roles):
+                print(f"\n{role}:")
+                for task in tasks:
+                    print(f"  - {task}")
             print("-" * 30)
         
     except Exception as e: